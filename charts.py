@@ -1,52 +1,138 @@
+import functools
 import typing as t
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
-import plotly.express as px
+import numpy as np
 import pandas as pd
+import PIL.Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
 BLUE, RED = "#4389E3", "#CC2F4A"
 LIGHT_BLUE, LIGHT_RED = "#CBCFDC", "#DEB3B3"
 COLORS_D = ["#86B6F2", "#4389E3", "#1666CB", "#0645B4", "#002B84"]
 COLORS_R = ["#E27F90", "#CC2F4A", "#D40000", "#AA0000", "#800000"]
 COLOR_GREY = "#D6D6D6"
+COLOR_MAP = {i: to_rgba(i) for i in COLORS_D+COLORS_R+[COLOR_GREY]}
+MAP_CENTER = [-99.7707, 31.3915]
+MAP_SPAN = 1200 / (512*2**5.75) * 360
+ROBOTO = FontProperties(family="Roboto", size=19)
 YEARS = [f"{i}" for i in range(2000, 2024, 4)]
 JSON = t.Union[str, int, float, bool, None,
                t.Mapping[str, 'JSON'], t.List['JSON']]
 
 
-def draw_map(geojson: JSON,
+def make_figure() -> Figure:
+    """Creates a 1200x1200 figure rendered by Agg.
+
+    The figure is not registered with pyplot, so plt.close() can't
+    invalidate it.
+
+    Returns:
+        The figure.
+    """
+    fig = Figure(figsize=(12, 12), dpi=100)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+@functools.lru_cache(maxsize=None)
+def get_chart_axes() -> plt.Axes:
+    """Gets the axes reused by create_chart(), creating them on first use.
+
+    Returns:
+        The axes.
+    """
+    return make_figure().subplots()
+
+
+def to_image(fig: plt.Figure) -> PIL.Image.Image:
+    """Renders a figure into an image, without writing it to disk.
+
+    Args:
+        fig (plt.Figure): the figure.
+
+    Returns:
+        The rendered image.
+    """
+    fig.canvas.draw()
+    return PIL.Image.frombytes("RGBA", fig.canvas.get_width_height(),
+                               bytes(fig.canvas.buffer_rgba()))
+
+
+def project(coordinates: t.List[t.List[float]]) -> np.ndarray:
+    """Projects longitudes and latitudes onto the Web Mercator plane.
+
+    Args:
+        coordinates (t.List[t.List[float]]): the [longitude, latitude] pairs.
+
+    Returns:
+        The projected coordinates, in degrees.
+    """
+    lon, lat = np.asarray(coordinates, dtype=float).T
+    y = np.degrees(np.log(np.tan(np.pi/4 + np.radians(lat)/2)))
+    return np.column_stack([lon, y])
+
+
+def make_map(geojson: JSON) -> plt.Axes:
+    """Creates an empty map of Texas, to be colored by draw_map().
+
+    Args:
+        geojson (JSON): the GEOJSON object used to draw the map.
+
+    Returns:
+        The axes containing the map, with one hidden collection
+        per subdivision, its gid being the code of the subdivision.
+    """
+    ax = make_figure().subplots()
+    ax.set_position([0, 0, 1, 1])
+    ax.set_axis_off()
+    for feature in geojson["features"]:
+        polygons = feature["geometry"]["coordinates"]
+        if feature["geometry"]["type"] == "Polygon":
+            polygons = [polygons]
+        # 1.44pt is 2px at 100 dpi.
+        collection = PolyCollection([project(i[0]) for i in polygons],
+                                    edgecolor="white",
+                                    linewidth=1.44,
+                                    visible=False)
+        collection.set_gid(str(feature["id"]))
+        ax.add_collection(collection)
+    x, y = project([MAP_CENTER])[0]
+    ax.set_xlim(x - MAP_SPAN/2, x + MAP_SPAN/2)
+    ax.set_ylim(y - MAP_SPAN/2, y + MAP_SPAN/2)
+    return ax
+
+
+def draw_map(ax: plt.Axes,
              data: pd.DataFrame,
              location_column: str,
-             color_column: str,
-             map_name: str) -> None:
-    """Draws a map of Texas using the data provided.
+             color_column: str) -> PIL.Image.Image:
+    """Colors a map created by make_map() using the data provided.
 
     Args:
-        geojson (JSON): the GEOJSON object used to draw the map.
+        ax (plt.Axes): the axes returned by make_map().
         data (pd.DataFrame): a DataFrame containing the data,
             columns must contain location_column and color_column.
         location_column (str): the name of the column containing
             the code of the subdivision (county/state).
         color_column (str): the name of the column containing
-            the colors to be drawn.
-        map_name (str): the name of the.
-    """ 
-    color_map = {i: i for i in COLORS_D+COLORS_R+[COLOR_GREY]}
-    fig = px.choropleth_mapbox(data,
-                               geojson=geojson,
-                               locations=location_column,
-                               color=color_column,
-                               color_discrete_map=color_map,
-                               range_color=(-100, 100),
-                               mapbox_style="white-bg",
-                               zoom=5.75,
-                               center={"lat": 31.3915, "lon": -99.7707})
-    fig.update_layout(margin={"r": 0,
-                              "t": 0,
-                              "l": 0,
-                              "b": 0})
-    fig.update_traces(marker_line_color="white",
-                      marker_line_width=2,
-                      showlegend=False)
-    fig.write_image(map_name, width=1200, height=1200)
+            the colors to be drawn. Subdivisions missing from
+            the data are not drawn.
+
+    Returns:
+        The image of the map.
+    """
+    colors = dict(zip(data[location_column].astype(str), data[color_column]))
+    for collection in ax.collections:
+        color = colors.get(collection.get_gid())
+        collection.set_visible(color is not None)
+        if color is not None:
+            collection.set_facecolor(COLOR_MAP.get(color, color))
+    return to_image(ax.figure)
 
 
 def draw_bar_chart(y: t.List[str],
@@ -106,35 +192,35 @@ def add_annot(text: str,
 
 
 def create_chart(values: t.List[t.List[float]],
-                 row_number: int,
-                 name: str) -> None:
+                 row_number: int) -> PIL.Image.Image:
     """Draws and edits a stacked horizontal barchart.
 
     Args:
         values (t.List[t.List[float]]): the values to be drawn.
         row_number (int): the number of the row to be highlighted
             and annottated. Should be in [0; 5].
-        name (str): the name of the chart.
+
+    Returns:
+        The image of the chart.
     """
-    fig, ax = plt.subplots(figsize=(12, 12), dpi=100)
+    ax = get_chart_axes()
+    ax.cla()
+    ax.set_xticks([])
     colors = [[LIGHT_BLUE]*6, [LIGHT_RED]*6]
     for i in range(2):
         colors[i][row_number] = [BLUE, RED][i]
     ax = draw_bar_chart(YEARS, values, colors, ax)
     ax = add_annot(f"   {round(values[0][row_number], 2)}%", row_number, ax,
-                   size = 19, fontfamily="Roboto")
+                   fontproperties=ROBOTO)
     ax = add_annot(f"   {round(values[1][row_number], 2)}%", row_number+6, ax,
-                   size = 19, fontfamily="Roboto")
-    for i in ["top", "right", "left", "bottom"]:
-        ax.spines[i].set_visible(False)
+                   fontproperties=ROBOTO)
+    ax.set_frame_on(False)
     ax.tick_params(axis="both", which="major", length=0,
                    labelsize=19)
-    ax.set_xticks([])
     ax.margins(x=0, y=0)
     ax.invert_yaxis()
     ax.yaxis.tick_right()
-    plt.savefig(name)
-    ax.cla()
+    return to_image(ax.figure)
 
     
 if __name__ == "__main__":
@@ -2,36 +2,133 @@ import utils
 import charts
 import parsing
 import typing as t
+import numpy as np
 import pandas as pd
 import json
+import os
 import sys
+import PIL.Image
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import repeat
 from time import time
 STATES = ["El Norte", "Gulfland", "New Texas", "Plainland", "Trinity"]
 YEARS = [i for i in range(2000, 2024, 4)]
+_MAP = None
+
+
+def init_worker(geojson_path: str) -> None:
+    """Creates the map reused by every frame the worker draws.
+
+    Args:
+        geojson_path (str): the path of the GEOJSON used to draw the maps.
+    """
+    global _MAP
+    _MAP = charts.make_map(utils.read_json(geojson_path))
+
+
+def render_frame(i: int,
+                 year: int,
+                 state: str,
+                 map_data: pd.DataFrame,
+                 state_results: t.List[t.List[float]]) -> PIL.Image.Image:
+    """Draws the map and the chart of a state for one year and combines them.
+
+    Args:
+        i (int): the number of the year, used to highlight the chart row.
+        year (int): the year.
+        state (str): the state.
+        map_data (pd.DataFrame): the codes and colors of the year,
+            in the "code" and "color" columns.
+        state_results (t.List[t.List[float]]): the results of get_results().
+
+    Returns:
+        The resulting image.
+    """
+    image = utils.combine_images([
+        charts.draw_map(_MAP, map_data, "code", "color"),
+        charts.create_chart(state_results, i)])
+    return utils.add_text(image, (1100, 50), f"{state}, {year}",
+                          "Roboto-Regular.ttf", 45, fill=(0, 0, 0))
+
+
+def submit_state(executor: Executor,
+                 state: str,
+                 data: pd.DataFrame,
+                 by_unit: pd.DataFrame,
+                 arrays: t.Dict[str, np.ndarray]) -> t.Iterator[PIL.Image.Image]:
+    """Submits the frames of a state to be rendered by render_frame().
+
+    Args:
+        executor (Executor): the executor rendering the frames.
+        state (str): the state.
+        data (pd.DataFrame): data for all counties and states.
+        by_unit (pd.DataFrame): the states indexed by unit,
+            see get_results().
+        arrays (t.Dict[str, np.ndarray]): the columns of data,
+            see get_columns().
+
+    Returns:
+        An iterator over the frames, in the order of YEARS.
+    """
+    state_data = parsing.get_data(data, state, arrays)
+    state_results = parsing.get_results(by_unit, state)
+    codes = state_data["code"].to_numpy()
+    colors = state_data[[f"{year}" for year in YEARS]].to_numpy()
+    map_data = [pd.DataFrame({"code": codes, "color": colors[:, i]})
+                for i in range(len(YEARS))]
+    return executor.map(render_frame,
+                        range(len(YEARS)),
+                        YEARS,
+                        repeat(state),
+                        map_data,
+                        repeat(state_results))
+
+
+def write_gif(state: str,
+              frames: t.Iterator[PIL.Image.Image]) -> None:
+    """Waits for the frames of a state and joins them into a gif.
+
+    Args:
+        state (str): the state.
+        frames (t.Iterator[PIL.Image.Image]): the frames, as returned
+            by submit_state().
+    """
+    utils.make_gif(list(frames), f"{state}.gif")
+    print(f"{state} done")
+
 
-    
 def main() -> None:
     start_time = time()
-    pd.options.mode.chained_assignment = None
-    geojson = utils.read_json("tx-geojson.json")
-    data = pd.read_excel("tx-data.xlsx", header=0, index_col=0)
-    for state in STATES:
-        state_data = parsing.get_data(data, state)
-        state_results = parsing.get_results(data, state)
-        file_names = []
-        for i, year in enumerate(YEARS):
-            charts.draw_map(geojson, state_data, "code", f"{year}",
-                            f"{year}-map.png")
-            charts.create_chart(state_results, i, f"{year}-chart.png")
-            utils.combine_images([f"{year}-map.png", f"{year}-chart.png"],
-                                 f"{year}.png")
-            utils.add_text(f"{year}.png", (1100, 50), f"{state}, {year}",
-                           "Roboto-Regular.ttf", 45, fill=(0, 0, 0))
-            file_names += [f"{year}.png"] 
-        utils.make_gif(file_names, f"{state}.gif")  
-        print(f"{state} done")
+    columns = ["code", "state", "is_state", "unit"] + [f"{year}" for year in YEARS]
+    data = utils.read_excel_cached("tx-data.xlsx", "tx-data.parquet",
+                                   header=0, usecols=columns)
+    by_unit = data[data["is_state"] == 1].set_index("unit")
+    arrays = parsing.get_columns(data)
+    # Enough states in flight to keep every worker busy; the frames of
+    # later states are only submitted once a gif has been written, so
+    # finished frames don't pile up in memory.
+    window = -(-(os.cpu_count() or 1) // len(YEARS)) + 1
+    pending = deque()
+    if sys.platform.startswith("linux"):
+        # Forked workers inherit the map instead of each building their own.
+        # Fork is unsafe on macOS, which is why spawn is its default.
+        init_worker("tx-geojson.json")
+        pool_kwargs = {"mp_context": multiprocessing.get_context("fork")}
+    else:
+        pool_kwargs = {"initializer": init_worker,
+                       "initargs": ("tx-geojson.json",)}
+    with ProcessPoolExecutor(**pool_kwargs) as executor:
+        for state in STATES:
+            if len(pending) == window:
+                write_gif(*pending.popleft())
+            pending.append((state, submit_state(executor, state, data,
+                                                by_unit, arrays)))
+        while pending:
+            write_gif(*pending.popleft())
     print(f"{time()-start_time} seconds")
-    
-        
+
+
 if __name__ == "__main__":
     main()
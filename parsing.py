@@ -1,31 +1,51 @@
 import utils
 import typing as t
+import numpy as np
 import pandas as pd
 THRESH_MARGIN = [50, 60, 70, 80, 90, 100]
 YEARS = [i for i in range(2000, 2024, 4)]
 
 
+def get_columns(data: pd.DataFrame) -> t.Dict[str, np.ndarray]:
+    """Gets the columns used by get_data() as numpy arrays.
+
+    Args:
+        data (pd.DataFrame): data for all counties and states.
+
+    Returns:
+        The "code", "state", "is_state" and "unit" columns, and the
+        "values" of all years as a 2D array with one column per year.
+    """
+    columns = {i: data[i].to_numpy() for i in ["code", "state", "is_state", "unit"]}
+    columns["values"] = data[[f"{year}" for year in YEARS]].to_numpy(dtype=float)
+    return columns
+
+
 def get_data(data: pd.DataFrame,
-             state: str) -> pd.DataFrame:
+             state: str,
+             columns: t.Optional[t.Dict[str, np.ndarray]]=None) -> pd.DataFrame:
     """Filters data by an individual state. 
 
     Args:
         data (pd.DataFrame): data for all counties and states.
         state (str): the state.
+        columns (t.Optional[t.Dict[str, np.ndarray]]): the columns of data,
+            as returned by get_columns(). Passing them avoids converting
+            data again for every state. Defaults to None.
 
     Returns:
-        The filtered data, with only counties of the state provided left,
-        and other states greyed out.
+        The colors of the filtered data, with only counties of the state
+        provided left and other states, as well as missing values, greyed
+        out: a DataFrame with the "code" column and one column per year.
     """
-    conditions = ((data["state"] == state) | (data["is_state"] == 1)) & (data["unit"] != state)
-    state_data = data[conditions]
-    for year in YEARS:
-        data_year = state_data[f"{year}"].apply(lambda x: utils.get_color(x, THRESH_MARGIN))
-        state_data[f"{year}"] = data_year
-        state_data[f"{year}"] = state_data.apply(lambda x: utils.grey_out(x["state"],
-                                                                          x[f"{year}"],
-                                                                          state), axis = 1)
-    return state_data
+    if columns is None:
+        columns = get_columns(data)
+    is_colored = columns["state"] == state
+    conditions = (is_colored | (columns["is_state"] == 1)) & (columns["unit"] != state)
+    colors = utils.get_colors(columns["values"][conditions], THRESH_MARGIN)
+    colors = np.where(is_colored[conditions][:, None], colors, utils.COLOR_GREY)
+    return pd.DataFrame({"code": columns["code"][conditions],
+                         **{f"{year}": colors[:, i] for i, year in enumerate(YEARS)}})
 
 
 def get_results(data: pd.DataFrame,
@@ -33,14 +53,21 @@ def get_results(data: pd.DataFrame,
     """Gets state results.
 
     Args:
-        data (pd.DataFrame): data for all counties and states.
+        data (pd.DataFrame): data for the states, indexed by unit.
+            Counties must be left out, since a county may share its
+            unit with a state (e.g. Trinity County).
         state (str): the state.
 
     Returns:
         The results, transformed to be used by create_chart().
+
+    Raises:
+        ValueError: if more than one row of data has the state as its unit.
     """ 
-    results = data[data["unit"] == state].iloc[0].tolist()
-    results = [float(i) for i in results[-6:]]
-    d_results = [abs(i) if i < 0 else 100-i for i in results]
-    r_results = [100+i if i < 0 else i for i in results]
-    return [d_results, r_results]    
+    results = data.loc[state, [f"{year}" for year in YEARS]]
+    if results.ndim != 1:
+        raise ValueError(f"{len(results)} rows have {state!r} as their unit")
+    results = results.to_numpy(dtype=float)
+    d_results = np.where(results < 0, -results, 100-results)
+    r_results = np.where(results < 0, 100+results, results)
+    return [d_results.tolist(), r_results.tolist()]    
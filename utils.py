@@ -1,7 +1,13 @@
+import functools
+import hashlib
 import typing as t
-import imageio
+import imageio.v3 as iio
 import json
 import os
+import shutil
+import subprocess
+import numpy as np
+import pandas as pd
 import PIL
 from PIL import ImageDraw, ImageFont
 JSON = t.Union[str, int, float, bool, None,
@@ -12,6 +18,30 @@ COLOR_GREY = "#D6D6D6"
 THRESH_MARGIN = [50, 60, 70, 80, 90, 100]
 
 
+def get_colors(values: np.ndarray,
+               thresh: t.List[float]=THRESH_MARGIN) -> np.ndarray:
+    """Transforms an array of values into the corresponding colors.
+
+    Args:
+        values (np.ndarray): the values to be transformed.
+        thresh (t.List[float]): the list of threshold values,
+            defaults to THRESH_MARGIN.
+
+    Returns:
+        An array of the same shape as values, containing the colors from
+        COLORS_D for negative values and from COLORS_R for positive ones.
+        Values beyond the last threshold, in either direction, get the
+        darkest color, values up to the second threshold get the lightest
+        one. Missing (NaN) and infinite values get COLOR_GREY.
+    """
+    values = np.asarray(values, dtype=float)
+    bins = np.digitize(np.abs(values), thresh[1:-1], right=True)
+    colors = np.where(values < 0,
+                      np.array(COLORS_D)[bins],
+                      np.array(COLORS_R)[bins])
+    return np.where(np.isfinite(values), colors, COLOR_GREY)
+
+
 def get_color(value: float,
               thresh: t.List[float]=THRESH_MARGIN) -> str:
     """Transforms the value into the corresponding color.
@@ -25,6 +55,7 @@ def get_color(value: float,
         The color from COLORS_D or COLORS_R, corresponding to the value, with
         the color palette determined by whether the value is negative or
         positive: COLORS_D for negative values, COLORS_R for positive ones.
+        Missing (NaN) values get COLOR_GREY, see get_colors().
 
     Examples:
         >>> print(get_color(51.3))
@@ -33,12 +64,7 @@ def get_color(value: float,
         >>> print(get_color(-65.7))
         '#4389E3'
     """
-    colors = COLORS_D if value < 0 else COLORS_R
-    for i, (left, right) in enumerate(zip(thresh, thresh[1:])):
-        if left < abs(value) <= right:
-            return colors[i]
-    if value > thresh[-1]:
-        return colors[-1]
+    return str(get_colors(value, thresh))
     
 
 def read_json(path: str) -> JSON:
@@ -54,93 +80,131 @@ def read_json(path: str) -> JSON:
         return json.load(json_file)
 
 
-def grey_out(name: str,
-             color: str,
-             colored_name: str,
-             color_grey: str=COLOR_GREY) -> str:
-    """Turns the subdivision's color to grey if it should be greyed out.
+def read_excel_cached(path: str,
+                      cache_path: str,
+                      **kwargs) -> pd.DataFrame:
+    """Reads .xlsx file, caching it as .parquet to speed up later reads.
 
     Args:
-        name (str): the name of the subdivision.
-        color (str): the color to be used.
-        colored_name (str): the name of the subdivision that should be colored.
-        color_grey (str): the grey color used. Defaults to COLOR_GREY.
+        path (str): a file path.
+        cache_path (str): the path of the .parquet cache. A hash of kwargs
+            is appended to the file name, so each set of arguments gets
+            its own cache. The cache is rewritten whenever it is older
+            than the .xlsx file. Nothing is cached if no parquet engine,
+            such as pyarrow, is installed.
+        kwargs: keyword arguments passed to pd.read_excel().
 
     Returns:
-        Color, if the subdivision should not be greyed out;
-        otherwise, color_grey.
+        The data, represented as a DataFrame.
     """
-    return color if name == colored_name else color_grey
-
-    
-def make_gif(file_names: t.List[str],
+    key = hashlib.sha1(repr(sorted(kwargs.items())).encode()).hexdigest()[:8]
+    root, extension = os.path.splitext(cache_path)
+    cache_path = f"{root}-{key}{extension}"
+    if (os.path.exists(cache_path)
+            and os.path.getmtime(cache_path) >= os.path.getmtime(path)):
+        try:
+            return pd.read_parquet(cache_path)
+        except ImportError:
+            pass
+    data = pd.read_excel(path, **kwargs)
+    try:
+        data.to_parquet(cache_path)
+    except ImportError:
+        pass
+    return data
+
+
+def make_gif(images: t.List[PIL.Image.Image],
              gif_name: str,
-             frame_duration: float=1,
-             delete_files: bool=True) -> None:
+             frame_duration: float=1) -> None:
     """Creates a gif from a list of images.
 
+    The gif is encoded by ffmpeg with a palette generated from the frames,
+    if ffmpeg is installed, and by imageio otherwise.
+
     Args:
-        file_names (t.List[str]): the list of names of the images.
+        images (t.List[PIL.Image.Image]): the list of RGB images,
+            all of the same size.
         gif_name (str): the name of the resulting gif.
-        frame_duration (float): the duration of each frame, defaults to 1.
-        delete_files (bool): whether the delete the original files,
-            defaults to True.
+        frame_duration (float): the duration of each frame in seconds,
+            defaults to 1.
     """
-    with imageio.get_writer(gif_name, mode="i",
-                            duration=frame_duration) as writer:
-        for file_name in file_names:
-            image = imageio.imread(file_name)
-            writer.append_data(image)
-    if delete_files:
-        for file in file_names:
-            os.remove(file)
-
-
-def combine_images(file_names: t.List[str],
-                   image_name: str,
-                   delete_files: bool=True) -> None:
+    frames = np.stack([np.asarray(i) for i in images])
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        iio.imwrite(gif_name, frames, extension=".gif",
+                    duration=frame_duration*1000, loop=0)
+        return
+    height, width = frames.shape[1:3]
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error",
+                    "-f", "rawvideo", "-pix_fmt", "rgb24",
+                    "-s", f"{width}x{height}",
+                    "-framerate", str(1/frame_duration),
+                    "-i", "-",
+                    "-filter_complex",
+                    "[0:v]split[a][b];[a]palettegen=stats_mode=diff[p];"
+                    "[b][p]paletteuse=dither=none",
+                    "-loop", "0",
+                    gif_name],
+                   input=frames.tobytes(), check=True)
+
+
+def combine_images(images: t.List[PIL.Image.Image]) -> PIL.Image.Image:
     """Combines images horizontally.
 
     Args:
-        file_names (t.List[str]): the list of names of the images.
-        image_name: the name of the resulting image.
-        delete_files (bool): whether the delete the original files,
-            defaults to True.
+        images (t.List[PIL.Image.Image]): the list of images.
+
+    Returns:
+        The resulting image.
     """
-    images = [PIL.Image.open(i) for i in file_names]
-    widths, heights = zip(*(i.size for i in images))
-    total_width = sum(widths)
-    max_height = max(heights)
-    new_image = PIL.Image.new('RGB', (total_width, max_height))
+    images = [np.asarray(i.convert("RGB")) for i in images]
+    total_width = sum(i.shape[1] for i in images)
+    max_height = max(i.shape[0] for i in images)
+    new_image = np.zeros((max_height, total_width, 3), dtype=np.uint8)
     x_offset = 0
     for image in images:
-        new_image.paste(image, (x_offset,0))
-        x_offset += image.size[0]
-    new_image.save(image_name)
-    if delete_files:
-        for file in file_names:
-            os.remove(file)
+        height, width = image.shape[:2]
+        new_image[:height, x_offset:x_offset+width] = image
+        x_offset += width
+    return PIL.Image.fromarray(new_image)
+
+
+@functools.lru_cache(maxsize=16)
+def get_font(font_name: str,
+             size: float) -> ImageFont.FreeTypeFont:
+    """Loads a font, reusing it for later calls with the same arguments.
+
+    Args:
+        font_name (str): the name of the font.
+        size (float): the size of the font.
+
+    Returns:
+        The font.
+    """
+    return ImageFont.truetype(font_name, size)
 
 
-def add_text(file_name: str,
+def add_text(image: PIL.Image.Image,
              position: t.Tuple[float],
              text: str,
              font_name: str,
              size: float,
-             **kwargs) -> None:
+             **kwargs) -> PIL.Image.Image:
     """Adds text to an image.
 
     Args:
-        file_name (str): the list of name of the image.
+        image (PIL.Image.Image): the image, modified in place.
         position (t.Tuple[float]): the position of the text.
         text (str): the text.
         font_name (str): the name of the font.
         size (float): the size of the text.
         kwargs: keyword arguments passed to PIL.ImageDraw.Draw.text().
+
+    Returns:
+        The image containing the text.
     """
-    image = PIL.Image.open(file_name)
     draw_image = ImageDraw.Draw(image)
-    font = ImageFont.truetype(font_name, size)
+    font = get_font(font_name, size)
     draw_image.text(position, text, font = font, **kwargs)
-    image.save(file_name)
-      
+    return image